@@ -1,31 +1,47 @@
+from collections import deque
 from typing import Any
 import mcp.types as types
 from loguru import logger
 
+def evict_from_index(index: dict[str, deque], key: str, entry: Any) -> None:
+    """Remove entry, which was just evicted from the main buffer, from the head of index[key]."""
+    entries = index.get(key)
+    if entries and entries[0] is entry:
+        entries.popleft()
+        if not entries:
+            del index[key]
+
 class BaseToolHandler:
     """Base class for all tool handlers to standardize behavior and provide common utilities."""
     
-    _sessions: dict[str, Any] = {}
-    _playwright: Any = None
-
+    def __init__(self, sessions: dict[str, Any] | None = None):
+        # Handlers that should see the same browser sessions are given the same dict
+        self._sessions: dict[str, Any] = sessions if sessions is not None else {}
 
-    def add_session(session_id: str, session_info):
+    def add_session(self, session_id: str, session_info: Any) -> None:
+        # Re-insert so the most recently added session is always the last key
+        self._sessions.pop(session_id, None)
         self._sessions[session_id] = session_info
 
-    def get_session(session_id:str):
+    def get_session(self, session_id: str) -> Any:
         return self._sessions.get(session_id)
     
     async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
         """Base handle method to be implemented by subclasses."""
         raise NotImplementedError("Subclasses must implement this method")
     
+    @property
+    def _current_session_id(self) -> str | None:
+        """Id of the active (most recently added) session, or None if there is no session."""
+        # add_session keeps the active session as the last key, so this is O(1)
+        return next(reversed(self._sessions), None)
+    
     def _get_active_session(self) -> tuple[str, Any]:
         """Helper method to get the active session or raise an error if no session exists."""
-        logger.info(f"{self._sessions=}")
-        if not self._sessions:
-            raise ValueError(f"No active browser session({self._sessions=}). Please create a new session first.")
-        
-        session_id = list(self._sessions.keys())[-1]
+        logger.opt(lazy=True).debug("sessions={}", lambda: list(self._sessions))
+        session_id = self._current_session_id
+        if session_id is None:
+            raise ValueError("No active browser session. Please create a new session first.")
         return session_id, self._sessions[session_id]
     
     def _get_active_page(self) -> Any:
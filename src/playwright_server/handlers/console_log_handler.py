@@ -1,37 +1,92 @@
-import json
-import time
+import asyncio
+import os
+import weakref
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from collections import defaultdict, deque
+from itertools import islice
 from typing import Any
 from loguru import logger
 import mcp.types as types
-from .base_handler import BaseToolHandler
+from .base_handler import BaseToolHandler, evict_from_index
+from . import serialization
+
+# Maximum number of console messages kept per session; oldest entries are evicted first
+MAX_CONSOLE_LOGS = int(os.environ.get("PLAYWRIGHT_MAX_CONSOLE_LOGS", 10_000))
+
+@dataclass(slots=True)
+class ConsoleLogEntry:
+    """A console message captured from the page."""
+    
+    type: str
+    text: str
+    url: str
+    line_number: int | None
+    column_number: int | None
+    timestamp: str
+    
+    def to_dict(self) -> dict[str, Any]:
+        """Return the entry for serialization."""
+        return {
+            "type": self.type,
+            "text": self.text,
+            "location": {
+                "url": self.url,
+                "lineNumber": self.line_number,
+                "columnNumber": self.column_number,
+            },
+            "timestamp": self.timestamp,
+        }
 
 class ConsoleLogHandler(BaseToolHandler):
     """Handler for retrieving browser console logs."""
     
-    _console_logs: dict[str, list[dict[str, Any]]] = {}
+    _max_console_logs: int = MAX_CONSOLE_LOGS
+    
+    def __init__(self, sessions: dict[str, Any] | None = None):
+        super().__init__(sessions)
+        self._console_logs: dict[str, deque[ConsoleLogEntry]] = {}
+        # The same log entries indexed by message type, so type queries don't scan everything
+        self._console_logs_by_type: dict[str, defaultdict[str, deque[ConsoleLogEntry]]] = {}
+        self._console_log_events: dict[str, asyncio.Event] = {}
+        # Pages that already have our listeners attached
+        self._listener_pages: weakref.WeakSet[Any] = weakref.WeakSet()
     
     async def _setup_console_log_listener(self, page: Any, session_id: str) -> None:
         """Set up a listener for console messages on the given page."""
         if session_id not in self._console_logs:
-            self._console_logs[session_id] = []
+            self._console_logs[session_id] = deque(maxlen=self._max_console_logs)
+        if session_id not in self._console_logs_by_type:
+            # Pruned alongside the main buffer, so they never hold entries it has evicted
+            self._console_logs_by_type[session_id] = defaultdict(deque)
+        if session_id not in self._console_log_events:
+            self._console_log_events[session_id] = asyncio.Event()
+        
+        # Only add listener if not already added
+        if page in self._listener_pages:
+            return
             
-        async def handle_console(msg):
-            log_entry = {
-                "type": msg.type,
-                "text": msg.text,
-                "location": {
-                    "url": msg.page.url,
-                    "lineNumber": getattr(msg.location, "lineNumber", None),
-                    "columnNumber": getattr(msg.location, "columnNumber", None),
-                },
-                "timestamp": await page.evaluate("new Date().toISOString()"),
-            }
-            self._console_logs[session_id].append(log_entry)
+        def handle_console(msg):
+            location = msg.location
+            log_entry = ConsoleLogEntry(
+                type=msg.type,
+                text=msg.text,
+                url=msg.page.url,
+                line_number=location.get("lineNumber"),
+                column_number=location.get("columnNumber"),
+                timestamp=datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+            )
+            logs = self._console_logs[session_id]
+            logs_by_type = self._console_logs_by_type[session_id]
+            if logs and len(logs) == logs.maxlen:
+                # The entry about to be evicted is also the oldest one in its type index
+                evict_from_index(logs_by_type, logs[0].type, logs[0])
+            logs.append(log_entry)
+            logs_by_type[log_entry.type].append(log_entry)
+            self._console_log_events[session_id].set()
             
-        # Only add listener if not already added
-        if not hasattr(page, "_console_listener_added"):
-            page.on("console", handle_console)
-            setattr(page, "_console_listener_added", True)
+        page.on("console", handle_console)
+        self._listener_pages.add(page)
     
     async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent]:
         """Retrieve browser console logs for the current session."""
@@ -42,28 +97,39 @@ class ConsoleLogHandler(BaseToolHandler):
             # Make sure the console listener is set up
             await self._setup_console_log_listener(page, session_id)
 
-            logger.info(f"waiting 5 seconds for logs to accumulate")
-            time.sleep(5)  # Sleep for 10 seconds to allow logs to accumulate
-            logger.info(f"done waiting 5 seconds for logs to accumulate")
-            
-            # Get logs for this session
-            logs = self._console_logs.get(session_id, [])
+            # Optionally wait for a new log to arrive instead of returning immediately
+            wait_ms = arguments.get("wait_ms", 0) if arguments else 0
+            if wait_ms:
+                new_log = self._console_log_events[session_id]
+                new_log.clear()
+                logger.debug("waiting up to {}ms for new logs", wait_ms)
+                try:
+                    await asyncio.wait_for(new_log.wait(), timeout=wait_ms / 1000)
+                except asyncio.TimeoutError:
+                    pass
             
-            # Optional filtering by log type
+            # Optional filtering by log type and limit
             log_type = arguments.get("type") if arguments else None
-            if log_type:
-                logs = [log for log in logs if log["type"] == log_type]
-                
-            # Optional limit
             limit = arguments.get("limit", 100) if arguments else 100
-            logs = logs[-limit:]
+            if log_type:
+                logs = self._console_logs_by_type[session_id].get(log_type, ())
+            else:
+                logs = self._console_logs[session_id]
+            
+            # Only touch the newest `limit` entries
+            logs = list(islice(reversed(logs), limit))
+            logs.reverse()
+            
+            # Return structured logs unless human-readable text is requested
+            if not arguments or arguments.get("format", "json") != "text":
+                return [types.TextContent(type="text", text=serialization.dumps([log.to_dict() for log in logs]))]
             
             # Format logs for display
             formatted_logs = []
             for log in logs:
-                log_entry = f"[{log['timestamp']}] [{log['type']}] {log['text']}"
-                if log['location']['lineNumber'] is not None:
-                    log_entry += f" (at {log['location']['url']}:{log['location']['lineNumber']}:{log['location']['columnNumber']})"
+                log_entry = f"[{log.timestamp}] [{log.type}] {log.text}"
+                if log.line_number is not None:
+                    log_entry += f" (at {log.url}:{log.line_number}:{log.column_number})"
                 formatted_logs.append(log_entry)
             
             result = "\n".join(formatted_logs) if formatted_logs else "No console logs available."
@@ -1,98 +1,217 @@
-from typing import Any
-import json
+from typing import Any, Iterable
+import asyncio
+from dataclasses import dataclass
+from collections import defaultdict, deque
+from itertools import islice
+import os
+import weakref
+from datetime import datetime, timezone
 import mcp.types as types
-from .base_handler import BaseToolHandler
+from .base_handler import BaseToolHandler, evict_from_index
+from . import serialization
+
+# Maximum number of network events kept per session; oldest entries are evicted first
+MAX_NETWORK_EVENTS = int(os.environ.get("PLAYWRIGHT_MAX_NETWORK_EVENTS", 10_000))
+
+# Response bodies are only captured for text-like content types below this size (bytes)
+TEXT_CONTENT_TYPES = ("json", "text", "javascript", "css")
+MAX_BODY_SIZE = 10240
+
+# Responses waiting to be processed per session, and how many workers process them concurrently.
+# The workers are started with the session's listeners and live as long as the server, they are never cancelled.
+RESPONSE_QUEUE_SIZE = 1024
+RESPONSE_WORKERS = 4
+
+# How long to wait for a response body before giving up on it (seconds)
+BODY_TIMEOUT = 5
+
+
+@dataclass(slots=True)
+class NetworkEvent:
+    """A request seen on the page, updated in place once its response arrives."""
+    
+    url: str
+    method: str
+    resource_type: str
+    timestamp: str
+    request: weakref.ref
+    post_data: str | None = None
+    # Headers need a round-trip, so they are fetched lazily when the event is returned
+    headers: dict[str, str] | None = None
+    status: int | None = None
+    status_text: str | None = None
+    response_headers: dict[str, str] | None = None
+    response_size: int | None = None
+    response_body: str | None = None
+    is_json_response: bool = False
+    
+    def to_dict(self, include_headers: bool, include_body: bool) -> dict[str, Any]:
+        """Return the public fields of the event for serialization."""
+        data = {
+            "type": "request",
+            "url": self.url,
+            "method": self.method,
+            "post_data": self.post_data,
+            "resource_type": self.resource_type,
+            "timestamp": self.timestamp,
+            "status": self.status,
+            "status_text": self.status_text,
+            "response_size": self.response_size,
+        }
+        if include_headers:
+            data["headers"] = self.headers
+            data["response_headers"] = self.response_headers
+        if include_body:
+            data["response_body"] = self.response_body
+        return data
+
+def _post_data(request: Any) -> str | None:
+    """Return the request's post data, or None if there is none or it isn't UTF-8 text."""
+    # Decoded from the request's initializer, so this doesn't need a round-trip
+    try:
+        return request.post_data
+    except UnicodeDecodeError:
+        return None
 
 class NetworkHandler(BaseToolHandler):
     """Handler for retrieving browser network requests and responses."""
     
-    _network_events: dict[str, list[dict[str, Any]]] = {}
+    _max_network_events: int = MAX_NETWORK_EVENTS
+    
+    def __init__(self, sessions: dict[str, Any] | None = None):
+        super().__init__(sessions)
+        self._network_events: dict[str, deque[NetworkEvent]] = {}
+        # The same events indexed by method and resource type, so those filters don't scan everything
+        self._network_events_by_method: dict[str, defaultdict[str, deque[NetworkEvent]]] = {}
+        self._network_events_by_resource_type: dict[str, defaultdict[str, deque[NetworkEvent]]] = {}
+        # Maps Playwright request objects to their events, entries go away with the request
+        self._request_events: dict[str, weakref.WeakKeyDictionary[Any, NetworkEvent]] = {}
+        # Responses are queued by the listener and processed by a small pool of worker tasks
+        self._response_queues: dict[str, asyncio.Queue] = {}
+        self._response_consumers: dict[str, list[asyncio.Task]] = {}
+        # Pages that already have our listeners attached
+        self._listener_pages: weakref.WeakSet[Any] = weakref.WeakSet()
+    
+    async def _resolve_request_headers(self, events: Iterable[NetworkEvent]) -> None:
+        """Fill in the request headers on the events about to be returned."""
+        pending = []
+        for event in events:
+            request = event.request()
+            if request is not None and event.headers is None:
+                pending.append((event, request.all_headers()))
+        
+        if pending:
+            results = await asyncio.gather(*(headers for _, headers in pending), return_exceptions=True)
+            for (event, _), headers in zip(pending, results):
+                if not isinstance(headers, BaseException):
+                    event.headers = headers
+    
+    async def _record_response(self, session_id: str, response: Any) -> None:
+        """Update the matching request event with the response data."""
+        try:
+            # Find the corresponding request
+            event = self._request_events[session_id].get(response.request)
+            if event is not None:
+                # Update with response data
+                headers = await response.all_headers()
+                event.status = response.status
+                event.status_text = response.status_text
+                event.response_headers = headers
+                
+                # Take the response size from the headers when available
+                content_type = headers.get("content-type", "")
+                event.is_json_response = "json" in content_type
+                content_length = headers.get("content-length")
+                if content_length and content_length.isdigit():
+                    event.response_size = int(content_length)
+                
+                # Only fetch the body for small text responses (avoid pulling large binary data),
+                # event streams never finish so their body is never fetched
+                if (any(t in content_type for t in TEXT_CONTENT_TYPES) and
+                    "event-stream" not in content_type and
+                    (event.response_size is None or event.response_size < MAX_BODY_SIZE)):
+                    try:
+                        body = await asyncio.wait_for(response.body(), timeout=BODY_TIMEOUT)
+                        event.response_size = len(body)
+                        if len(body) < MAX_BODY_SIZE:
+                            try:
+                                event.response_body = body.decode('utf-8')
+                            except:
+                                pass
+                    except:
+                        # Some responses might not have a body
+                        pass
+        except Exception as e:
+            # Silently handle errors to prevent crashing the listener
+            pass
+    
+    async def _consume_responses(self, session_id: str) -> None:
+        """Process queued responses one at a time, several of these workers run per session."""
+        queue = self._response_queues[session_id]
+        while True:
+            response = await queue.get()
+            await self._record_response(session_id, response)
     
     async def _setup_network_listener(self, page: Any, session_id: str) -> None:
         """Set up listeners for network events on the given page."""
         if session_id not in self._network_events:
-            self._network_events[session_id] = []
+            self._network_events[session_id] = deque(maxlen=self._max_network_events)
+        if session_id not in self._network_events_by_method:
+            # The indexes are pruned alongside the main buffer, so they never hold events it has evicted
+            self._network_events_by_method[session_id] = defaultdict(deque)
+        if session_id not in self._network_events_by_resource_type:
+            self._network_events_by_resource_type[session_id] = defaultdict(deque)
+        if session_id not in self._request_events:
+            self._request_events[session_id] = weakref.WeakKeyDictionary()
+        if session_id not in self._response_queues:
+            self._response_queues[session_id] = asyncio.Queue(maxsize=RESPONSE_QUEUE_SIZE)
+            # Independent workers, so a slow response only holds up its own worker
+            self._response_consumers[session_id] = [
+                asyncio.create_task(self._consume_responses(session_id)) for _ in range(RESPONSE_WORKERS)
+            ]
+        
+        # Only add listeners if not already added
+        if page in self._listener_pages:
+            return
             
-        async def handle_request(request):
+        def handle_request(request):
             """Handle request events."""
             try:
-                headers = await request.all_headers()
-                post_data = None
-                
-                try:
-                    post_data = await request.post_data()
-                except:
-                    # Post data might not be available for all requests
-                    pass
+                request_data = NetworkEvent(
+                    url=request.url,
+                    method=request.method,
+                    resource_type=request.resource_type,
+                    timestamp=datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+                    request=weakref.ref(request),
+                    post_data=_post_data(request),
+                )
                 
-                request_data = {
-                    "id": id(request),
-                    "type": "request",
-                    "url": request.url,
-                    "method": request.method,
-                    "headers": headers,
-                    "post_data": post_data,
-                    "resource_type": request.resource_type,
-                    "timestamp": await page.evaluate("new Date().toISOString()"),
-                    "status": None,
-                    "status_text": None,
-                    "response_headers": None,
-                    "response_size": None,
-                    "response_body": None,
-                }
-                
-                self._network_events[session_id].append(request_data)
+                events = self._network_events[session_id]
+                by_method = self._network_events_by_method[session_id]
+                by_resource_type = self._network_events_by_resource_type[session_id]
+                if events and len(events) == events.maxlen:
+                    # The event about to be evicted is also the oldest one in its indexes
+                    oldest = events[0]
+                    evict_from_index(by_method, oldest.method, oldest)
+                    evict_from_index(by_resource_type, oldest.resource_type, oldest)
+                events.append(request_data)
+                by_method[request.method].append(request_data)
+                by_resource_type[request.resource_type].append(request_data)
+                self._request_events[session_id][request] = request_data
             except Exception as e:
                 # Silently handle errors to prevent crashing the listener
                 pass
         
-        async def handle_response(response):
-            """Handle response events."""
+        def handle_response(response):
+            """Queue response events, dropping them if the consumer falls too far behind."""
             try:
-                request = response.request
-                request_id = id(request)
-                
-                # Find the corresponding request
-                for event in self._network_events[session_id]:
-                    if event["id"] == request_id:
-                        # Update with response data
-                        headers = await response.all_headers()
-                        event.update({
-                            "status": response.status,
-                            "status_text": response.status_text,
-                            "response_headers": headers,
-                        })
-                        
-                        # Try to get response size
-                        try:
-                            body = await response.body()
-                            event["response_size"] = len(body)
-                            
-                            # For small text responses, include the body (limit to avoid large binary data)
-                            content_type = headers.get("content-type", "")
-                            if (len(body) < 10240 and 
-                                ("json" in content_type or 
-                                 "text" in content_type or 
-                                 "javascript" in content_type or 
-                                 "css" in content_type)):
-                                try:
-                                    event["response_body"] = body.decode('utf-8')
-                                except:
-                                    pass
-                        except:
-                            # Some responses might not have a body
-                            pass
-                            
-                        break
-            except Exception as e:
-                # Silently handle errors to prevent crashing the listener
+                self._response_queues[session_id].put_nowait(response)
+            except asyncio.QueueFull:
                 pass
         
-        # Only add listeners if not already added
-        if not hasattr(page, "_network_listener_added"):
-            page.on("request", handle_request)
-            page.on("response", handle_response)
-            setattr(page, "_network_listener_added", True)
+        page.on("request", handle_request)
+        page.on("response", handle_response)
+        self._listener_pages.add(page)
     
     async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent]:
         """Retrieve browser network activity for the current session."""
@@ -103,83 +222,88 @@ class NetworkHandler(BaseToolHandler):
             # Make sure the network listener is set up
             await self._setup_network_listener(page, session_id)
             
-            # Get network events for this session
-            events = self._network_events.get(session_id, [])
+            # Collect filter arguments once
+            args = arguments or {}
+            url_filter = args.get("url")
+            method_filter = args.get("method")
+            status_min = args.get("status_min")
+            status_max = args.get("status_max")
+            resource_type = args.get("resource_type")
+            limit = args.get("limit", 50)
+            show_headers = args.get("show_headers", False)
+            show_body = args.get("show_body", False)
             
-            # Apply filters if provided
-            if arguments:
-                # Filter by URL
-                url_filter = arguments.get("url")
-                if url_filter:
-                    events = [e for e in events if url_filter in e["url"]]
-                
-                # Filter by method
-                method_filter = arguments.get("method")
-                if method_filter:
-                    events = [e for e in events if e["method"] == method_filter]
-                
-                # Filter by status code range
-                status_min = arguments.get("status_min")
-                if status_min is not None:
-                    events = [e for e in events if e["status"] is not None and e["status"] >= status_min]
-                
-                status_max = arguments.get("status_max")
-                if status_max is not None:
-                    events = [e for e in events if e["status"] is not None and e["status"] <= status_max]
-                
-                # Filter by resource type
-                resource_type = arguments.get("resource_type")
-                if resource_type:
-                    events = [e for e in events if e["resource_type"] == resource_type]
+            def keep(e: NetworkEvent) -> bool:
+                status = e.status
+                return (
+                    (not url_filter or url_filter in e.url)
+                    and (not method_filter or e.method == method_filter)
+                    and (status_min is None or (status is not None and status >= status_min))
+                    and (status_max is None or (status is not None and status <= status_max))
+                    and (not resource_type or e.resource_type == resource_type)
+                )
+            
+            # Start from the narrowest index that matches the filters
+            if resource_type:
+                source = self._network_events_by_resource_type[session_id].get(resource_type, ())
+            elif method_filter:
+                source = self._network_events_by_method[session_id].get(method_filter, ())
+            else:
+                source = self._network_events[session_id]
+            
+            # Walk newest first and stop once `limit` matching events are found
+            events = list(islice((e for e in reversed(source) if keep(e)), limit))
+            events.reverse()
             
-            # Apply limit
-            limit = arguments.get("limit", 50) if arguments else 50
-            events = events[-limit:]
+            # Fetch the request headers, which are only collected on demand
+            if show_headers:
+                await self._resolve_request_headers(events)
+            
+            # Return structured events unless human-readable text is requested
+            if args.get("format", "json") != "text":
+                data = [e.to_dict(show_headers, show_body) for e in events]
+                return [types.TextContent(type="text", text=serialization.dumps(data))]
             
             # Format the events for display
             result = []
             for event in events:
-                entry = f"[{event['timestamp']}] {event['method']} {event['url']} ({event['resource_type']})"
-                if event["status"] is not None:
-                    entry += f" - Status: {event['status']} {event['status_text']}"
-                    
-                if event["response_size"] is not None:
-                    entry += f", Size: {event['response_size']} bytes"
-                
-                result.append(entry)
+                status = event.status
+                response_size = event.response_size
+                parts = [f"[{event.timestamp}] {event.method} {event.url} ({event.resource_type})"]
+                if status is not None:
+                    parts.append(f" - Status: {status} {event.status_text}")
+                if response_size is not None:
+                    parts.append(f", Size: {response_size} bytes")
+                result.append("".join(parts))
                 
                 # Add headers if requested
-                if arguments and arguments.get("show_headers", False):
-                    if event["headers"]:
+                if show_headers:
+                    if event.headers:
                         result.append("  Request Headers:")
-                        for key, value in event["headers"].items():
-                            result.append(f"    {key}: {value}")
+                        result.append("\n".join(f"    {key}: {value}" for key, value in event.headers.items()))
                     
-                    if event["response_headers"]:
+                    if event.response_headers:
                         result.append("  Response Headers:")
-                        for key, value in event["response_headers"].items():
-                            result.append(f"    {key}: {value}")
+                        result.append("\n".join(f"    {key}: {value}" for key, value in event.response_headers.items()))
                 
                 # Add response body if available and requested
-                if arguments and arguments.get("show_body", False) and event.get("response_body"):
+                if show_body and event.response_body:
                     result.append("  Response Body:")
                     
                     # Try to pretty print JSON
-                    body = event["response_body"]
-                    try:
-                        if "json" in event.get("response_headers", {}).get("content-type", ""):
-                            body_obj = json.loads(body)
-                            body = json.dumps(body_obj, indent=2)
-                    except:
-                        pass
+                    body = event.response_body
+                    if event.is_json_response:
+                        try:
+                            body = serialization.reformat(body)
+                        except:
+                            pass
                         
                     # Limit body size for display
                     if len(body) > 1000:
                         body = body[:1000] + "... [truncated]"
                         
                     # Add body with indentation
-                    for line in body.split("\n"):
-                        result.append(f"    {line}")
+                    result.append("    " + body.replace("\n", "\n    "))
             
             formatted_result = "\n".join(result) if result else "No network activity recorded."
             return [types.TextContent(type="text", text=formatted_result)]
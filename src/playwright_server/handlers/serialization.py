@@ -0,0 +1,25 @@
+"""
+JSON helpers used by the handlers.
+orjson is used when it is installed, otherwise the stdlib json module is used.
+"""
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj: Any) -> str:
+    """Serialize obj to a compact JSON string, falling back to str() for unknown types."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str).decode("utf-8")
+    return json.dumps(obj, default=str, ensure_ascii=False)
+
+
+def reformat(text: str) -> str:
+    """Pretty print a JSON document with a 2 space indent."""
+    if orjson is not None:
+        return orjson.dumps(orjson.loads(text), option=orjson.OPT_INDENT_2).decode("utf-8")
+    return json.dumps(json.loads(text), indent=2)
@@ -1,10 +1,10 @@
-from typing import Any
+from typing import Any, Mapping
 
 class SessionInitializer:
     """Helper class to manage browser session initialization and listeners."""
     
     @staticmethod
-    async def initialize_session(session_id: str, page: Any, handlers: dict[str, Any]) -> None:
+    async def initialize_session(session_id: str, page: Any, handlers: Mapping[str, Any]) -> None:
         """Initialize a new browser session with all required listeners."""
         # Extract console log and network handlers
         console_handler = handlers.get("playwright_get_console_logs")
@@ -1,55 +1,202 @@
 import asyncio
+import inspect
+import sys
+from types import MappingProxyType
+from typing import Any
 from playwright_server.handlers.base_handler import BaseToolHandler
 
 from mcp.server.models import InitializationOptions
 import mcp.types as types
 from mcp.server import NotificationOptions, Server
-from pydantic import AnyUrl
 import mcp.server.stdio
 from loguru import logger
 
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
 # Import our new handlers
 from playwright_server.handlers.console_log_handler import ConsoleLogHandler
 from playwright_server.handlers.network_handler import NetworkHandler
 from playwright_server.handlers.session_initializer import SessionInitializer
+from playwright_server.handlers import serialization
 
-server = Server("playwright-server")
 
-@server.list_resources()
-async def handle_list_resources() -> list[types.Resource]:
-    """
-    List available note resources.
-    Each note is exposed as a resource with a custom note:// URI scheme.
-    """
-    return []
+class _FastStackInspect:
+    """Stands in for the inspect module inside Playwright, with a cheaper stack()."""
 
-@server.read_resource()
-async def handle_read_resource(uri: AnyUrl) -> str:
-    """
-    Read a specific note's content by its URI.
-    The note name is extracted from the URI host component.
-    """
-    raise ValueError(f"Unsupported URI scheme: {uri.scheme}")
+    def __getattr__(self, name: str) -> Any:
+        return getattr(inspect, name)
 
+    @staticmethod
+    def stack(context: int = 1) -> list[inspect.FrameInfo]:
+        # Same frames as inspect.stack(), without resolving source files for each of them
+        frames = []
+        frame = sys._getframe(1)
+        while frame is not None:
+            code = frame.f_code
+            frames.append(inspect.FrameInfo(frame, code.co_filename, frame.f_lineno, code.co_name, None, None))
+            frame = frame.f_back
+        return frames
 
-@server.list_prompts()
-async def handle_list_prompts() -> list[types.Prompt]:
-    """
-    List available prompts.
-    Each prompt can have optional arguments to customize its behavior.
-    """
-    return []
 
-@server.get_prompt()
-async def handle_get_prompt(
-    name: str, arguments: dict[str, str] | None
-) -> types.GetPromptResult:
+def _patch_playwright_stack_capture() -> None:
     """
-    Generate a prompt by combining arguments with server state.
-    The prompt includes all current notes and can be customized via arguments.
+    Older Playwright releases call inspect.stack() on every API call to find the caller,
+    which resolves the source file of every frame and dominates CPU under load.
+    Newer releases walk the frames themselves and are left untouched.
     """
-    raise ValueError(f"Unknown prompt: {name}")
+    try:
+        from playwright._impl import _connection
+    except ImportError:
+        return
+    if hasattr(_connection, "_capture_stack_trace") or getattr(_connection, "inspect", None) is not inspect:
+        return
+    _connection.inspect = _FastStackInspect()
+
+_patch_playwright_stack_capture()
 
+server = Server("playwright-server")
+
+# The tool list is static, so it is built once at import time
+TOOLS: list[types.Tool] = [
+    types.Tool(
+        name="playwright_new_session",
+        description="Create a new browser session",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "url": {"type": "string", "description": "Initial URL to navigate to"}
+            }
+        }
+    ),
+    types.Tool(
+        name="playwright_navigate",
+        description="Navigate to a URL, this op will auto create a session",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "url": {"type": "string"}
+            },
+            "required": ["url"]
+        }
+    ),
+    types.Tool(
+        name="playwright_screenshot",
+        description="Take a screenshot of the current page or a specific element",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "name": {"type": "string"},
+                "selector": {"type": "string", "description": "CSS selector for element to screenshot, null is full page"},
+            },
+            "required": ["name"]
+        }
+    ),
+    types.Tool(
+        name="playwright_click",
+        description="Click an element on the page using CSS selector",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "selector": {"type": "string", "description": "CSS selector for element to click"},
+                "expect_popup": {"type": "boolean", "description": "Wait for the click to open a new page and switch to it"}
+            },
+            "required": ["selector"]
+        }
+    ),
+    types.Tool(
+        name="playwright_fill",
+        description="Fill out an input field",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "selector": {"type": "string", "description": "CSS selector for input field"},
+                "value": {"type": "string", "description": "Value to fill"}
+            },
+            "required": ["selector", "value"]
+        }
+    ),
+    types.Tool(
+        name="playwright_evaluate",
+        description="Execute JavaScript in the browser console",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "script": {"type": "string", "description": "JavaScript code to execute"}
+            },
+            "required": ["script"]
+        }
+    ),
+    types.Tool(
+        name="playwright_click_text",
+        description="Click an element on the page by its text content",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "text": {"type": "string", "description": "Text content of the element to click"},
+                "expect_popup": {"type": "boolean", "description": "Wait for the click to open a new page and switch to it"}
+            },
+            "required": ["text"]
+        }
+    ),
+    types.Tool(
+        name="playwright_get_text_content",
+        description="Get the text content of all elements",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "limit": {"type": "integer", "description": "Maximum number of texts to collect, defaults to 500"},
+                "format": {"type": "string", "enum": ["json", "text"], "description": "Output format, defaults to json"}
+            },
+        }
+    ),
+    types.Tool(
+        name="playwright_get_html_content",
+        description="Get the HTML content of the page",
+         inputSchema={
+            "type": "object",
+            "properties": {
+                "selector": {"type": "string", "description": "CSS selector for the element"}
+            },
+            "required": ["selector"]
+        }
+    ),
+    # New tool for getting console logs
+    types.Tool(
+        name="playwright_get_console_logs",
+        description="Get the browser console logs",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "type": {"type": "string", "description": "Filter logs by type (e.g., 'log', 'error', 'warning')"},
+                "limit": {"type": "integer", "description": "Maximum number of logs to retrieve"},
+                "wait_ms": {"type": "integer", "description": "Wait up to this many milliseconds for a new log before returning"},
+                "format": {"type": "string", "enum": ["json", "text"], "description": "Output format, defaults to json"}
+            }
+        }
+    ),
+    # New tool for getting network activity
+    types.Tool(
+        name="playwright_get_network_activity",
+        description="Get the browser network activity",
+        inputSchema={
+            "type": "object",
+            "properties": {
+                "url": {"type": "string", "description": "Filter by URL substring"},
+                "method": {"type": "string", "description": "Filter by HTTP method (GET, POST, etc.)"},
+                "status_min": {"type": "integer", "description": "Minimum status code to include"},
+                "status_max": {"type": "integer", "description": "Maximum status code to include"},
+                "resource_type": {"type": "string", "description": "Filter by resource type (document, stylesheet, image, etc.)"},
+                "limit": {"type": "integer", "description": "Maximum number of events to retrieve"},
+                "show_headers": {"type": "boolean", "description": "Include request and response headers"},
+                "show_body": {"type": "boolean", "description": "Include response body for text responses"},
+                "format": {"type": "string", "enum": ["json", "text"], "description": "Output format, defaults to json"}
+            }
+        }
+    )
+]
 
 @server.list_tools()
 async def handle_list_tools() -> list[types.Tool]:
@@ -57,327 +204,264 @@ async def handle_list_tools() -> list[types.Tool]:
     List available tools.
     Each tool specifies its arguments using JSON Schema validation.
     """
-    return [
-        types.Tool(
-            name="playwright_new_session",
-            description="Create a new browser session",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "url": {"type": "string", "description": "Initial URL to navigate to"}
-                }
-            }
-        ),
-        types.Tool(
-            name="playwright_navigate",
-            description="Navigate to a URL, this op will auto create a session",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "url": {"type": "string"}
-                },
-                "required": ["url"]
-            }
-        ),
-        types.Tool(
-            name="playwright_screenshot",
-            description="Take a screenshot of the current page or a specific element",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "name": {"type": "string"},
-                    "selector": {"type": "string", "description": "CSS selector for element to screenshot, null is full page"},
-                },
-                "required": ["name"]
-            }
-        ),
-        types.Tool(
-            name="playwright_click",
-            description="Click an element on the page using CSS selector",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "selector": {"type": "string", "description": "CSS selector for element to click"}
-                },
-                "required": ["selector"]
-            }
-        ),
-        types.Tool(
-            name="playwright_fill",
-            description="Fill out an input field",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "selector": {"type": "string", "description": "CSS selector for input field"},
-                    "value": {"type": "string", "description": "Value to fill"}
-                },
-                "required": ["selector", "value"]
-            }
-        ),
-        types.Tool(
-            name="playwright_evaluate",
-            description="Execute JavaScript in the browser console",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "script": {"type": "string", "description": "JavaScript code to execute"}
-                },
-                "required": ["script"]
-            }
-        ),
-        types.Tool(
-            name="playwright_click_text",
-            description="Click an element on the page by its text content",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "text": {"type": "string", "description": "Text content of the element to click"}
-                },
-                "required": ["text"]
-            }
-        ),
-        types.Tool(
-            name="playwright_get_text_content",
-            description="Get the text content of all elements",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                },
-            }
-        ),
-        types.Tool(
-            name="playwright_get_html_content",
-            description="Get the HTML content of the page",
-             inputSchema={
-                "type": "object",
-                "properties": {
-                    "selector": {"type": "string", "description": "CSS selector for the element"}
-                },
-                "required": ["selector"]
-            }
-        ),
-        # New tool for getting console logs
-        types.Tool(
-            name="playwright_get_console_logs",
-            description="Get the browser console logs",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "type": {"type": "string", "description": "Filter logs by type (e.g., 'log', 'error', 'warning')"},
-                    "limit": {"type": "integer", "description": "Maximum number of logs to retrieve"}
-                }
-            }
-        ),
-        # New tool for getting network activity
-        types.Tool(
-            name="playwright_get_network_activity",
-            description="Get the browser network activity",
-            inputSchema={
-                "type": "object",
-                "properties": {
-                    "url": {"type": "string", "description": "Filter by URL substring"},
-                    "method": {"type": "string", "description": "Filter by HTTP method (GET, POST, etc.)"},
-                    "status_min": {"type": "integer", "description": "Minimum status code to include"},
-                    "status_max": {"type": "integer", "description": "Maximum status code to include"},
-                    "resource_type": {"type": "string", "description": "Filter by resource type (document, stylesheet, image, etc.)"},
-                    "limit": {"type": "integer", "description": "Maximum number of events to retrieve"},
-                    "show_headers": {"type": "boolean", "description": "Include request and response headers"},
-                    "show_body": {"type": "boolean", "description": "Include response body for text responses"}
-                }
-            }
-        )
-    ]
+    return TOOLS
 
 import uuid
-from playwright.async_api import async_playwright
+from playwright.async_api import async_playwright, Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError
 import base64
-import os
+from concurrent.futures import ThreadPoolExecutor
 
 import asyncio
 
-def update_page_after_click(func):
+# How long a click with expect_popup waits for the new page to open (milliseconds)
+POPUP_TIMEOUT = 3000
+
+# Screenshots are base64 encoded on these threads so large images don't block the event loop
+screenshot_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="screenshot")
+# Bytes encoded per slice, a multiple of 3 so the slices encode without padding
+BASE64_CHUNK_SIZE = 786432
+
+def _b64encode_chunked(data: bytes) -> bytes:
+    """base64 encode data in slices, so the GIL is released between them and the event loop can run."""
+    view = memoryview(data)
+    return b"".join(base64.b64encode(view[i:i + BASE64_CHUNK_SIZE]) for i in range(0, len(view), BASE64_CHUNK_SIZE))
+
+# One Playwright driver and browser shared by all sessions, each session gets its own context
+_playwright: Any = None
+_browser: Any = None
+_browser_lock = asyncio.Lock()
+
+async def _get_browser() -> Any:
+    """Return the shared browser, starting Playwright and launching it on first use."""
+    global _playwright, _browser
+    async with _browser_lock:
+        if _playwright is None:
+            _playwright = await async_playwright().start()
+        if _browser is None or not _browser.is_connected():
+            _browser = await _playwright.chromium.launch(headless=False)
+        return _browser
+
+def _normalize_url(url: str) -> str:
+    """Default to https when the url has no http(s) scheme."""
+    if not url.startswith(("http://", "https://")):
+        url = "https://" + url
+    return url
+
+def require_session(func):
+    """Return an error when there is no session, otherwise pass the active page and session id to the handler."""
     async def wrapper(self, name: str, arguments: dict | None):
-        if not self._sessions:
+        session_id = self._current_session_id
+        if session_id is None:
             return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
-        session_id = list(self._sessions.keys())[-1]
-        page = self._sessions[session_id]["page"]
-        
-        new_page_future = asyncio.ensure_future(page.context.wait_for_event("page", timeout=3000))
+        return await func(self, name, arguments, page=self._sessions[session_id]["page"], session_id=session_id)
+    return wrapper
+
+def update_page_after_click(func):
+    async def wrapper(self, name: str, arguments: dict | None, *, page: Any, session_id: str):
+        # Only clicks the caller expects to open a new page wait for one
+        if not arguments or not arguments.get("expect_popup"):
+            return await func(self, name, arguments, page=page, session_id=session_id)
         
-        result = await func(self, name, arguments)
+        result = None
         try:
-            new_page = await new_page_future
-            await new_page.wait_for_load_state()
-            self._sessions[session_id]["page"] = new_page
-        except:
-            pass
-            # if page.url != self._sessions[session_id]["page"].url:
-            #     await page.wait_for_load_state()
-            #     self._sessions[session_id]["page"] = page
+            async with page.context.expect_page(timeout=POPUP_TIMEOUT) as new_page_info:
+                result = await func(self, name, arguments, page=page, session_id=session_id)
+            new_page = await new_page_info.value
+        except PlaywrightTimeoutError:
+            if result is None:
+                # The click itself timed out
+                raise
+            return result
         
+        await new_page.wait_for_load_state()
+        self._sessions[session_id]["page"] = new_page
         return result
     return wrapper
 
 
 class NewSessionToolHandler(BaseToolHandler):
     async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-        self._playwright = await async_playwright().start()
-        browser = await self._playwright.chromium.launch(headless=False)
-        page = await browser.new_page()
+        browser = await _get_browser()
+        context = await browser.new_context()
+        # Open the page and define the text content helper on every document of the context
+        # (including popups) concurrently, both are done before the first navigation
+        page, _ = await asyncio.gather(context.new_page(), context.add_init_script(GET_UNIQUE_TEXTS_INIT_SCRIPT))
         session_id = str(uuid.uuid4())
-        self._sessions[session_id] = {"browser": browser, "page": page}
+        self.add_session(session_id, {"browser": browser, "context": context, "page": page})
         
         # Initialize the session with our listeners
         await SessionInitializer.initialize_session(session_id, page, tool_handlers)
         
         url = arguments.get("url")
         if url:
-            if not url.startswith("http://") and not url.startswith("https://"):
-                url = "https://" + url
-            await page.goto(url)
+            await page.goto(_normalize_url(url))
         return [types.TextContent(type="text", text=f"{session_id=} New session ({url=}) created.({len(self._sessions)})")]
 
 class NavigateToolHandler(BaseToolHandler):
     async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
         if not self._sessions:
-            await NewSessionToolHandler().handle("", {})
+            await NewSessionToolHandler(self._sessions).handle("", {})
             # return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
-        session_id = list(self._sessions.keys())[-1]
+        session_id = self._current_session_id
         page = self._sessions[session_id]["page"]
-        url = arguments.get("url")
-        if not url.startswith("http://") and not url.startswith("https://"):
-            url = "https://" + url
+        url = _normalize_url(arguments.get("url"))
         await page.goto(url)
-        text_content = await GetTextContentToolHandler().handle("", {})
-        return [types.TextContent(type="text", text=f"{session_id=} Navigated to {url}\npage_text_content[:200]:\n\n{text_content[:200]}")]
+        # Only a preview is returned, so don't collect more texts than needed
+        text_content = await GetTextContentToolHandler(self._sessions).handle("", {"limit": 50})
+        return [types.TextContent(type="text", text=f"{session_id=} Navigated to {url}\npage_text_content[:200]:\n\n{text_content[0].text[:200]}")]
 
 class ScreenshotToolHandler(BaseToolHandler):
-    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-        if not self._sessions:
-            return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
-        session_id = list(self._sessions.keys())[-1]
-        page = self._sessions[session_id]["page"]
-        name = arguments.get("name")
+    @require_session
+    async def handle(self, name: str, arguments: dict | None, *, page: Any, session_id: str) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
         selector = arguments.get("selector")
         # full_page = arguments.get("fullPage", False)
+        # Screenshots are returned as bytes, no need to round-trip through a file
         if selector:
-            element = await page.locator(selector)
-            await element.screenshot(path=f"{name}.png")
+            png_bytes = await page.locator(selector).screenshot()
         else:
-            await page.screenshot(path=f"{name}.png", full_page=True)
-        with open(f"{name}.png", "rb") as image_file:
-            encoded_string = base64.b64encode(image_file.read()).decode("utf-8")
-        os.remove(f"{name}.png")
+            png_bytes = await page.screenshot(full_page=True)
+        encoded = await asyncio.get_running_loop().run_in_executor(screenshot_executor, _b64encode_chunked, png_bytes)
+        encoded_string = encoded.decode("ascii")
         return [types.ImageContent(type="image", data=encoded_string, mimeType="image/png")]
 
 class ClickToolHandler(BaseToolHandler):
+    @require_session
     @update_page_after_click
-    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-        if not self._sessions:
-            return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
-        session_id = list(self._sessions.keys())[-1]
-        page = self._sessions[session_id]["page"]
+    async def handle(self, name: str, arguments: dict | None, *, page: Any, session_id: str) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
         selector = arguments.get("selector")
         await page.locator(selector).click()
         return [types.TextContent(type="text", text=f"Clicked element with selector {selector}")]
 
 class FillToolHandler(BaseToolHandler):
-    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-        if not self._sessions:
-            return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
-        session_id = list(self._sessions.keys())[-1]
-        page = self._sessions[session_id]["page"]
+    @require_session
+    async def handle(self, name: str, arguments: dict | None, *, page: Any, session_id: str) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
         selector = arguments.get("selector")
         value = arguments.get("value")
         await page.locator(selector).fill(value)
         return [types.TextContent(type="text", text=f"Filled element with selector {selector} with value {value}")]
 
 class EvaluateToolHandler(BaseToolHandler):
-    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-        if not self._sessions:
-            return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
-        session_id = list(self._sessions.keys())[-1]
-        page = self._sessions[session_id]["page"]
+    @require_session
+    async def handle(self, name: str, arguments: dict | None, *, page: Any, session_id: str) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
         script = arguments.get("script")
         result = await page.evaluate(script)
         return [types.TextContent(type="text", text=f"Evaluated script, result: {result}")]
 
 class ClickTextToolHandler(BaseToolHandler):
+    @require_session
     @update_page_after_click
-    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-        if not self._sessions:
-            return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
-        session_id = list(self._sessions.keys())[-1]
-        page = self._sessions[session_id]["page"]
+    async def handle(self, name: str, arguments: dict | None, *, page: Any, session_id: str) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
         text = arguments.get("text")
         await page.locator(f"text={text}").nth(0).click()
         return [types.TextContent(type="text", text=f"Clicked element with text {text}")]
 
-class GetTextContentToolHandler(BaseToolHandler):
-    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-        if not self._sessions:
-            return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
-        session_id = list(self._sessions.keys())[-1]
-        page = self._sessions[session_id]["page"]
-
-        async def get_unique_texts_js(page):
-            unique_texts = await page.evaluate('''() => {
-            var elements = Array.from(document.querySelectorAll('*')); // Select all elements and filter
-            var uniqueTexts = new Set();
-
-            for (var element of elements) {
-                if (element.offsetWidth > 0 || element.offsetHeight > 0) { // Check if visible
-                    var childrenCount = element.querySelectorAll('*').length;
-                    if (childrenCount <= 3) {
-                        var innerText = element.innerText ? element.innerText.trim() : '';
-                        if (innerText && innerText.length <= 1000) {
-                            uniqueTexts.add(innerText);
-                        }
-                        var value = element.getAttribute('value');
-                        if (value) {
-                            uniqueTexts.add(value);
-                        }
-                    }
+# Collects the unique visible texts of the page. Registered once per document as
+# window.__getUniqueTexts via an init script so the source isn't re-sent on every call.
+GET_UNIQUE_TEXTS_JS = '''(limit = 500) => {
+    // Whether the element has at most `max` descendant elements, visiting no more than max + 1 of them
+    function hasFewDescendants(element, max) {
+        var count = 0;
+        var node = element.firstElementChild;
+        while (node) {
+            if (++count > max) return false;
+            if (node.firstElementChild) {
+                node = node.firstElementChild;
+                continue;
+            }
+            while (node !== element && !node.nextElementSibling) node = node.parentElement;
+            if (node === element) break;
+            node = node.nextElementSibling;
+        }
+        return true;
+    }
+
+    var uniqueTexts = new Set();
+    // Walk the DOM lazily and skip subtrees that aren't rendered
+    var walker = document.createTreeWalker(document.documentElement, NodeFilter.SHOW_ELEMENT, {
+        acceptNode: function (element) {
+            if (element.getClientRects().length > 0) return NodeFilter.FILTER_ACCEPT;
+            // Box-less elements such as display: contents wrappers can still render their children
+            return getComputedStyle(element).display === 'none' ? NodeFilter.FILTER_REJECT : NodeFilter.FILTER_SKIP;
+        }
+    });
+
+    var element;
+    while (uniqueTexts.size < limit && (element = walker.nextNode())) {
+        var rect = element.getBoundingClientRect();
+        if (rect.width > 0 || rect.height > 0) { // Check if visible
+            if (hasFewDescendants(element, 3)) {
+                var innerText = element.innerText ? element.innerText.trim() : '';
+                if (innerText && innerText.length <= 1000) {
+                    uniqueTexts.add(innerText);
+                }
+                var value = element.getAttribute('value');
+                if (value) {
+                    uniqueTexts.add(value);
                 }
             }
-            return Array.from(uniqueTexts);
         }
-        ''')
+    }
+    return Array.from(uniqueTexts);
+}
+'''
+GET_UNIQUE_TEXTS_INIT_SCRIPT = f"window.__getUniqueTexts = {GET_UNIQUE_TEXTS_JS};"
+
+class GetTextContentToolHandler(BaseToolHandler):
+    @require_session
+    async def handle(self, name: str, arguments: dict | None, *, page: Any, session_id: str) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
+
+        async def get_unique_texts_js(page, limit):
+            unique_texts = await page.evaluate("limit => window.__getUniqueTexts ? window.__getUniqueTexts(limit) : null", limit)
+            if unique_texts is None:
+                # Document was loaded before the init script was registered
+                unique_texts = await page.evaluate(GET_UNIQUE_TEXTS_JS, limit)
             return unique_texts
 
-        # Get unique texts
-        text_contents = await get_unique_texts_js(page)
+        # Get unique texts, stopping once `limit` have been found
+        limit = arguments.get("limit", 500) if arguments else 500
+        text_contents = await get_unique_texts_js(page, limit)
 
+        # Return the texts as a JSON array unless human-readable text is requested
+        if not arguments or arguments.get("format", "json") != "text":
+            return [types.TextContent(type="text", text=serialization.dumps(text_contents))]
         return [types.TextContent(type="text", text=f"Text content of all elements: {text_contents}")]
 
 class GetHtmlContentToolHandler(BaseToolHandler):
-    async def handle(self, name: str, arguments: dict | None) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
-        if not self._sessions:
-            return [types.TextContent(type="text", text="No active session. Please create a new session first.")]
-        session_id = list(self._sessions.keys())[-1]
-        page = self._sessions[session_id]["page"]
+    @require_session
+    async def handle(self, name: str, arguments: dict | None, *, page: Any, session_id: str) -> list[types.TextContent | types.ImageContent | types.EmbeddedResource]:
         selector = arguments.get("selector")
-        html_content = await page.locator(selector).inner_html()
+        try:
+            # One round-trip, without the locator's waiting and actionability checks
+            html_content = await page.evaluate("selector => document.querySelector(selector)?.innerHTML ?? null", selector)
+        except PlaywrightError:
+            # Not a plain CSS selector (e.g. text=...)
+            html_content = None
+        if html_content is None:
+            # Let Playwright resolve it, its engines also pierce shadow DOM and wait for the element
+            html_content = await page.locator(selector).inner_html()
         return [types.TextContent(type="text", text=f"HTML content of element with selector {selector}: {html_content}")]
 
+# Browser sessions shared by every tool handler
+sessions: dict[str, Any] = {}
+
 # Import our new handlers and initialize them
-console_log_handler = ConsoleLogHandler()
-network_handler = NetworkHandler()
-
-# Add the new handlers to the tool handler dictionary
-tool_handlers = {
-    "playwright_navigate": NavigateToolHandler(),
-    "playwright_screenshot": ScreenshotToolHandler(),
-    "playwright_click": ClickToolHandler(),
-    "playwright_fill": FillToolHandler(),
-    "playwright_evaluate": EvaluateToolHandler(),
-    "playwright_click_text": ClickTextToolHandler(),
-    "playwright_get_text_content": GetTextContentToolHandler(),
-    "playwright_get_html_content": GetHtmlContentToolHandler(),
-    "playwright_new_session": NewSessionToolHandler(),
+console_log_handler = ConsoleLogHandler(sessions)
+network_handler = NetworkHandler(sessions)
+
+# Add the new handlers to the tool handler dictionary (read-only once built)
+tool_handlers = MappingProxyType({
+    "playwright_navigate": NavigateToolHandler(sessions),
+    "playwright_screenshot": ScreenshotToolHandler(sessions),
+    "playwright_click": ClickToolHandler(sessions),
+    "playwright_fill": FillToolHandler(sessions),
+    "playwright_evaluate": EvaluateToolHandler(sessions),
+    "playwright_click_text": ClickTextToolHandler(sessions),
+    "playwright_get_text_content": GetTextContentToolHandler(sessions),
+    "playwright_get_html_content": GetHtmlContentToolHandler(sessions),
+    "playwright_new_session": NewSessionToolHandler(sessions),
     "playwright_get_console_logs": console_log_handler,
     "playwright_get_network_activity": network_handler,
-}
+})
 
 @server.call_tool()
 async def handle_call_tool(
@@ -387,11 +471,11 @@ async def handle_call_tool(
     Handle tool execution requests.
     Tools can modify server state and notify clients of changes.
     """
-    if name in tool_handlers:
-        logger.info(f"calling: {name=} with {arguments=}")
-        return await tool_handlers[name].handle(name, arguments)
-    else:
+    handler = tool_handlers.get(name)
+    if handler is None:
         raise ValueError(f"Unknown tool: {name}")
+    logger.info("calling: name={!r} with arguments={!r}", name, arguments)
+    return await handler.handle(name, arguments)
 
 async def main():
     # Run the server using stdin/stdout streams
@@ -409,5 +493,11 @@ async def main():
             ),
         )
 
+def run() -> None:
+    """Run the server, on a uvloop event loop when uvloop is installed."""
+    loop_factory = uvloop.new_event_loop if uvloop is not None else None
+    with asyncio.Runner(loop_factory=loop_factory) as runner:
+        runner.run(main())
+
 if __name__ == "__main__":
-    asyncio.run(main())
+    run()